@@ -1,33 +1,63 @@
+import mmap
+import re
 import numpy as np
-from collections import Counter
+import matplotlib
+matplotlib.use('Agg')  # render to file only, without loading a GUI toolkit
 import matplotlib.pyplot as plt
+from functools import lru_cache
+
+# Sequence lines: group 1 is each non-blank line stripped of surrounding whitespace (including a
+# CRLF "\r"), like line.strip(). Lines starting with '>', even after indentation, are headers
+SEQUENCE_LINE = re.compile(rb'(?m)^[^\S\r\n]*([^>\s](?:[^\r\n]*\S)?)')
+# Sequences histogrammed per bincount call in calculate_entropy
+ROW_BLOCK = 1024
+
+@lru_cache(maxsize=8)
+def plogp_table(total):
+    # p*log2(p) for every possible count k/total, so entropy is a table lookup
+    k = np.arange(total + 1, dtype=np.float64)
+    prob = k / total
+    table = prob * np.log2(prob, out=np.zeros_like(prob), where=k > 0)
+    table.flags.writeable = False  # shared between calls through the cache
+    return table
 
 def calculate_entropy(alignment_file):
-    with open(alignment_file, 'r') as f:
-        sequences = [line.strip() for line in f.readlines() if not line.startswith('>')]
+    with open(alignment_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        sequences = [m.group(1) for m in SEQUENCE_LINE.finditer(mm)]
 
-    seq_length = len(sequences[0])
-    entropy_values = []
+    lengths = {len(seq) for seq in sequences}
+    if len(lengths) != 1:
+        raise ValueError(f"alignment rows differ in length ({sorted(lengths)}) in {alignment_file}")
 
-    for i in range(seq_length):
-        column = [seq[i] for seq in sequences]
-        count = Counter(column)
-        total = len(column)
-        prob = [count[char] / total for char in count]
-        entropy = -sum(p * np.log2(p) for p in prob)
-        entropy_values.append(entropy)
+    # One row per sequence, one column per alignment position
+    alignment = np.frombuffer(b''.join(sequences), dtype=np.uint8).reshape(len(sequences), -1)
+    total, seq_length = alignment.shape
 
-    return entropy_values
+    # Histogram every (residue, column) pair with bincount, ROW_BLOCK rows at a time so the
+    # flat index array stays small, then keep only the observed residues
+    n_cells = 256 * seq_length
+    index_dtype = np.int32 if n_cells < 2**31 else np.int64
+    offsets = np.arange(seq_length, dtype=index_dtype)
+    counts = np.zeros(n_cells, dtype=np.intp)
+    for start in range(0, total, ROW_BLOCK):
+        cells = alignment[start:start + ROW_BLOCK].astype(index_dtype) * seq_length + offsets
+        counts += np.bincount(cells.ravel(), minlength=n_cells)
+    counts = counts.reshape(256, seq_length)
+    counts = counts[counts.any(axis=1)]
+    entropy_values = -plogp_table(total)[counts].sum(axis=0)
+
+    return entropy_values.tolist()
 
 def plot_entropy(entropy_values, output_file):
-    plt.plot(entropy_values)
-    plt.xlabel('Position in Alignment')
-    plt.ylabel('Entropy')
-    plt.title('Entropy Plot (Per-Column)')
-    plt.savefig(output_file)
-    plt.show()
+    fig, ax = plt.subplots()
+    ax.plot(entropy_values)
+    ax.set_xlabel('Position in Alignment')
+    ax.set_ylabel('Entropy')
+    ax.set_title('Entropy Plot (Per-Column)')
+    fig.savefig(output_file, dpi=100)
+    plt.close(fig)
 
 # Usage
-entropy_values = calculate_entropy("example/msa.aln")
-plot_entropy(entropy_values, "entropy_plot.png")
-
+if __name__ == "__main__":
+    entropy_values = calculate_entropy("example/msa.aln")
+    plot_entropy(entropy_values, "entropy_plot.png")
@@ -4,7 +4,7 @@ from pathlib import Path
 def build_hmm(alignment: Path, hmm_output: Path):
     """Build HMM from Stockholm alignment."""
     subprocess.run(
-        f"hmmbuild {hmm_output} {alignment}",
-        shell=True,
+        ["hmmbuild", str(hmm_output), str(alignment)],
+        stdout=subprocess.DEVNULL,
         check=True
     )
@@ -6,13 +6,12 @@ search SwissProt sequences, and evaluate predictions.
 
 Steps:
 1. Select human Kunitz sequences for training.
-2. Build multiple sequence alignment (MSA) with Clustal Omega.
-3. Convert alignment to Stockholm format for HMMER.
-4. Build profile HMM from MSA.
-5. Prepare validation sets: non-human Kunitz positives and negatives.
-6. Run hmmsearch on validation set.
-7. Evaluate predictions: confusion matrix, precision, recall, F1, accuracy.
-8. Plot performance metrics.
+2. Build multiple sequence alignment (MSA) with Clustal Omega and stream it into
+   hmmbuild to build the profile HMM.
+3. Prepare validation sets: non-human Kunitz positives and negatives.
+4. Run hmmsearch on validation set.
+5. Evaluate predictions: confusion matrix, precision, recall, F1, accuracy.
+6. Plot performance metrics.
 
 
 Usage:
@@ -21,7 +20,7 @@ Usage:
 Required Tools:
 - HMMER (hmmbuild, hmmsearch)
 - Clustal Omega (clustalo)
-- Biopython, scikit-learn, matplotlib
+- Biopython, NumPy, matplotlib
 
 Vanessa EL DEBS
 Lab of Bioinformatics - Prof. Capriotti - University of Bologna
@@ -33,9 +32,14 @@ import os
 import sys
 import random
 import logging
-
-from Bio import SeqIO, AlignIO
-from sklearn.metrics import confusion_matrix, precision_score, recall_score, f1_score, accuracy_score
+import itertools
+import shutil
+import tempfile
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from Bio import SeqIO
 import matplotlib.pyplot as plt
 
 # Setup logging configuration
@@ -50,58 +54,119 @@ def parse_args():
     parser.add_argument("--outdir", default="results", help="Output directory")
     parser.add_argument("--clustalo", default="clustalo", help="Path to Clustal Omega executable")
     parser.add_argument("--seed", type=int, default=42, help="Random seed for reproducibility")
+    parser.add_argument("--cpu", type=int, default=os.cpu_count() or 1, help="Number of threads for hmmsearch")
+    parser.add_argument("--shards", type=int, default=1, help="Number of parallel hmmsearch processes")
     return parser.parse_args()
 
 
 def run_command(command, description):
     try:
-        subprocess.run(command, check=True)
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
     except subprocess.CalledProcessError as e:
-        logger.error(f"Error during {description}: {e}")
+        logger.error("Error during %s: %s", description, e)
         sys.exit(1)
 
 
-def select_human_kunitz(fasta_file, outdir):
+def write_fasta(records, out_file):
+    """Write raw (header, body) FASTA records to a file exactly as they were read."""
+    with open(out_file, "wb") as out:
+        for header, body in records:
+            out.write(header)
+            out.write(body)
+
+
+def iter_fasta_records(fasta_file, classify):
+    """Yield (label, header, body) raw byte records from a FASTA file.
+
+    `classify` is called on every header line (bytes, including the leading '>')
+    and returns a label for records to keep, or None to skip them. Sequence
+    lines of skipped records are never buffered.
+    """
+    with open(fasta_file, "rb") as fh:
+        label, header, body = None, None, []
+        for line in fh:
+            if line[:1] == b">":
+                if label is not None:
+                    yield label, header, b"".join(body)
+                header = line
+                label = classify(line)
+                body = []
+            elif label is not None:
+                body.append(line)
+        if label is not None:
+            body = b"".join(body)
+            # Terminate a final line missing its newline so records can be written back verbatim
+            yield label, header, body if not body or body.endswith(b"\n") else body + b"\n"
+
+
+def partition_swissprot(fasta_file, n_negatives, seed):
+    """Split SwissProt in a single pass into human Kunitz, non-human Kunitz and sampled negatives."""
+    logger.info("Scanning SwissProt...")
+    rng = random.Random(seed)
+    n_others = 0
+
+    def classify(header):
+        nonlocal n_others
+        desc = header.lower()
+        if b"kunitz" in desc:
+            return "human" if b"homo sapiens" in desc else "nonhuman"
+        # Reservoir sampling (Algorithm R): the slot is drawn from the header alone,
+        # so only the n_negatives kept records ever have their sequence buffered
+        slot = n_others if n_others < n_negatives else rng.randint(0, n_others)
+        n_others += 1
+        return slot if slot < n_negatives else None
+
+    human_kunitz = []
+    nonhuman_kunitz = []
+    negatives = []
+    for label, header, body in iter_fasta_records(fasta_file, classify):
+        record = (header, body)
+        if label == "human":
+            human_kunitz.append(record)
+        elif label == "nonhuman":
+            nonhuman_kunitz.append(record)
+        elif label == len(negatives):
+            negatives.append(record)
+        else:
+            negatives[label] = record
+    return human_kunitz, nonhuman_kunitz, negatives
+
+
+def select_human_kunitz(human_kunitz, outdir):
     logger.info("Selecting human Kunitz sequences for training...")
-    human_kunitz = [r for r in SeqIO.parse(fasta_file, "fasta")
-                    if "kunitz" in r.description.lower() and "homo sapiens" in r.description.lower()]
     if not human_kunitz:
         raise RuntimeError("No human Kunitz sequences found in SwissProt.")
     out_file = os.path.join(outdir, "train", "training_human_kunitz.fasta")
-    SeqIO.write(human_kunitz, out_file, "fasta")
+    write_fasta(human_kunitz, out_file)
     return out_file
 
 
-def build_msa(input_fasta, clustal_file, clustalo_path):
-    logger.info("Building MSA with Clustal Omega...")
-    run_command([clustalo_path, "-i", input_fasta, "-o", clustal_file, "--force", "--outfmt", "clustal"],
-                "Clustal Omega alignment")
-
-
-def convert_to_stockholm(clustal_file, stockholm_file):
-    alignment = AlignIO.read(clustal_file, "clustal")
-    AlignIO.write(alignment, stockholm_file, "stockholm")
-
-
-def build_hmm(stockholm_file, hmm_file):
-    logger.info("Building profile HMM...")
-    run_command(["hmmbuild", hmm_file, stockholm_file], "HMM building")
+def build_msa_and_hmm(input_fasta, hmm_file, clustalo_path):
+    """Align `input_fasta` with Clustal Omega and pipe the Stockholm MSA straight into hmmbuild."""
+    logger.info("Building MSA with Clustal Omega and profile HMM...")
+    clustalo = subprocess.Popen([clustalo_path, "-i", input_fasta, "--outfmt", "st"], stdout=subprocess.PIPE)
+    # An MSA read from stdin has no file name to derive the HMM name from
+    hmm_name = os.path.splitext(os.path.basename(hmm_file))[0]
+    try:
+        hmmbuild = subprocess.Popen(["hmmbuild", "--informat", "stockholm", "-n", hmm_name, hmm_file, "-"],
+                                    stdin=clustalo.stdout, stdout=subprocess.DEVNULL)
+    except OSError as e:
+        clustalo.kill()
+        clustalo.stdout.close()
+        clustalo.wait()
+        logger.error("Error during HMM building: %s", e)
+        sys.exit(1)
+    clustalo.stdout.close()  # so clustalo gets SIGPIPE if hmmbuild exits early
+    hmmbuild.wait()
+    clustalo.wait()
+    for proc, description in ((clustalo, "Clustal Omega alignment"), (hmmbuild, "HMM building")):
+        if proc.returncode != 0:
+            logger.error("Error during %s: exit status %d", description, proc.returncode)
+            sys.exit(1)
 
 
-def create_validation_sets(fasta_file, outdir, n_negatives, seed):
+def create_validation_sets(positives, negatives, outdir):
     logger.info("Creating validation sets...")
-    positives = []
-    others = []
-    for record in SeqIO.parse(fasta_file, "fasta"):
-        desc = record.description.lower()
-        if "kunitz" in desc and "homo sapiens" not in desc:
-            positives.append(record)
-        elif "kunitz" not in desc:
-            others.append(record)
-
-    random.seed(seed)
-    negatives = random.sample(others, min(n_negatives, len(others)))
-
     val_dir = os.path.join(outdir, "validation")
     os.makedirs(val_dir, exist_ok=True)
 
@@ -109,31 +174,94 @@ def create_validation_sets(fasta_file, outdir, n_negatives, seed):
     neg_file = os.path.join(val_dir, "negatives.fasta")
     test_file = os.path.join(val_dir, "test_set.fasta")
 
-    SeqIO.write(positives, pos_file, "fasta")
-    SeqIO.write(negatives, neg_file, "fasta")
-    SeqIO.write(positives + negatives, test_file, "fasta")
+    write_fasta(positives, pos_file)
+    write_fasta(negatives, neg_file)
+    # The test set is just positives followed by negatives: concatenate the files
+    with open(test_file, "wb") as out:
+        for part in (pos_file, neg_file):
+            with open(part, "rb") as f:
+                shutil.copyfileobj(f, out)
 
     return pos_file, neg_file, test_file
 
 
-def run_hmmsearch(hmm_file, fasta_file, tblout_file):
+def split_fasta(fasta_file, shard_files):
+    """Distribute FASTA records round-robin over `shard_files`; return the number of records."""
+    counter = itertools.count()
+    n_records = 0
+    with ExitStack() as stack:
+        outs = [stack.enter_context(open(path, "wb")) for path in shard_files]
+        for shard, header, body in iter_fasta_records(fasta_file, lambda header: next(counter) % len(outs)):
+            outs[shard].write(header)
+            outs[shard].write(body)
+            n_records += 1
+    return n_records
+
+
+def merge_tblout(shard_tblouts, tblout_file):
+    """Concatenate per-shard tblout files, keeping only the first shard's comment lines."""
+    with open(tblout_file, "wb") as out:
+        for i, path in enumerate(shard_tblouts):
+            with open(path, "rb") as f:
+                for line in f:
+                    if i == 0 or line[:1] != b"#":
+                        out.write(line)
+
+
+def run_hmmsearch(hmm_file, fasta_file, tblout_file, n_threads=os.cpu_count() or 1, n_shards=1):
     logger.info("Running hmmsearch...")
-    run_command(["hmmsearch", "--tblout", tblout_file, hmm_file, fasta_file], "hmmsearch")
+    if n_shards <= 1:
+        run_command(["hmmsearch", "--cpu", str(n_threads), "--tblout", tblout_file, hmm_file, fasta_file],
+                    "hmmsearch")
+        return
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(tblout_file)) as shard_dir:
+        shard_files = [os.path.join(shard_dir, f"shard_{i}.fasta") for i in range(n_shards)]
+        n_records = split_fasta(fasta_file, shard_files)
+        # Round-robin fills the first n_records shards; hmmsearch rejects empty target files
+        shard_files = shard_files[:max(1, min(n_shards, n_records))]
+        n_shards = len(shard_files)
+        cpu_per_shard = max(1, n_threads // n_shards)
+        # -Z keeps E-values relative to the whole test set rather than to each shard
+        commands = [["hmmsearch", "--cpu", str(cpu_per_shard), "-Z", str(n_records),
+                     "--tblout", shard + ".tbl", hmm_file, shard] for shard in shard_files]
+        with ThreadPoolExecutor(max_workers=n_shards) as pool:
+            list(pool.map(lambda command: run_command(command, "hmmsearch"), commands))
+        merge_tblout([shard + ".tbl" for shard in shard_files], tblout_file)
+
+
+# Prints the target name of every tblout hit whose full-sequence E-value (field 5) is <= e
+TBLOUT_FILTER = '!/^#/ && $5 ~ /^[0-9.]+([eE][-+]?[0-9]+)?$/ && $5 + 0 <= e + 0 { print $1 }'
 
 
 def parse_tblout(tblout_file, evalue_cutoff):
+    # The per-line E-value filter runs in awk; the pure-Python reader is the fallback
+    # Pass a plain number: awk misreads repr() of NumPy scalars, and "inf" differs between awks
+    cutoff = "%.17g" % min(float(evalue_cutoff), sys.float_info.max)
+    try:
+        result = subprocess.run(["awk", "-v", f"e={cutoff}", TBLOUT_FILTER, str(tblout_file)],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return parse_tblout_lines(tblout_file, evalue_cutoff)
+    return set(result.stdout.decode().split())
+
+
+def parse_tblout_lines(tblout_file, evalue_cutoff):
     hits = set()
-    with open(tblout_file) as f:
+    with open(tblout_file, "rb") as f:
         for line in f:
-            if not line.startswith("#"):
-                parts = line.strip().split()
-                if len(parts) > 4:
-                    try:
-                        evalue = float(parts[4])
-                        if evalue <= evalue_cutoff:
-                            hits.add(parts[0])
-                    except ValueError:
-                        continue
+            if line[:1] == b"#":
+                continue
+            # Only the target name (field 1) and full-sequence E-value (field 5) are needed
+            parts = line.split(None, 5)
+            if len(parts) < 5:
+                continue
+            try:
+                evalue = float(parts[4])
+            except ValueError:
+                continue
+            if evalue <= evalue_cutoff:
+                hits.add(parts[0].decode())
     return hits
 
 
@@ -142,17 +270,24 @@ def evaluate(hits, pos_fa, neg_fa, outdir):
     pos_ids = {r.id for r in SeqIO.parse(pos_fa, "fasta")}
     neg_ids = {r.id for r in SeqIO.parse(neg_fa, "fasta")}
 
-    y_true = [1] * len(pos_ids) + [0] * len(neg_ids)
-    y_pred = [1 if i in hits else 0 for i in pos_ids] + [1 if i in hits else 0 for i in neg_ids]
+    y_true = np.zeros(len(pos_ids) + len(neg_ids), dtype=bool)
+    y_true[:len(pos_ids)] = True
+    y_pred = np.fromiter((i in hits for ids in (pos_ids, neg_ids) for i in ids), dtype=bool, count=len(y_true))
+
+    tp = int((y_true & y_pred).sum())
+    fp = int((~y_true & y_pred).sum())
+    fn = int((y_true & ~y_pred).sum())
+    tn = int((~y_true & ~y_pred).sum())
 
     logger.info("\nEvaluation Metrics:")
-    logger.info("Confusion Matrix:")
-    logger.info(confusion_matrix(y_true, y_pred))
-    prec = precision_score(y_true, y_pred)
-    rec = recall_score(y_true, y_pred)
-    f1 = f1_score(y_true, y_pred)
-    acc = accuracy_score(y_true, y_pred)
-    logger.info(f"Precision: {prec:.3f}\nRecall: {rec:.3f}\nF1 Score: {f1:.3f}\nAccuracy: {acc:.3f}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Confusion Matrix:\n%s", np.array([[tn, fp], [fn, tp]]))
+    # Undefined ratios are reported as 0, as scikit-learn does
+    prec = tp / (tp + fp) if tp + fp else 0.0
+    rec = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * tp / (2 * tp + fp + fn) if tp + fp + fn else 0.0
+    acc = (tp + tn) / len(y_true)
+    logger.info("Precision: %.3f\nRecall: %.3f\nF1 Score: %.3f\nAccuracy: %.3f", prec, rec, f1, acc)
 
     plot_metrics(prec, rec, f1, acc, outdir)
 
@@ -179,18 +314,15 @@ def main():
     os.makedirs(args.outdir, exist_ok=True)
     os.makedirs(os.path.join(args.outdir, "train"), exist_ok=True)
 
-    training_fasta = select_human_kunitz(args.swissprot, args.outdir)
-    clustal_file = os.path.join(args.outdir, "train", "training.aln")
-    stockholm_file = os.path.join(args.outdir, "train", "training.sto")
+    human_kunitz, nonhuman_kunitz, negatives = partition_swissprot(args.swissprot, args.n_neg, args.seed)
+    training_fasta = select_human_kunitz(human_kunitz, args.outdir)
     hmm_file = os.path.join(args.outdir, "train", "kunitz.hmm")
     tblout_file = os.path.join(args.outdir, "validation", "hits.tbl")
 
-    build_msa(training_fasta, clustal_file, args.clustalo)
-    convert_to_stockholm(clustal_file, stockholm_file)
-    build_hmm(stockholm_file, hmm_file)
+    build_msa_and_hmm(training_fasta, hmm_file, args.clustalo)
 
-    pos_fa, neg_fa, test_fa = create_validation_sets(args.swissprot, args.outdir, args.n_neg, args.seed)
-    run_hmmsearch(hmm_file, test_fa, tblout_file)
+    pos_fa, neg_fa, test_fa = create_validation_sets(nonhuman_kunitz, negatives, args.outdir)
+    run_hmmsearch(hmm_file, test_fa, tblout_file, args.cpu, args.shards)
     hits = parse_tblout(tblout_file, args.evalue)
     evaluate(hits, pos_fa, neg_fa, args.outdir)
 
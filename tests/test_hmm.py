@@ -1,9 +1,108 @@
+import shutil
 import pytest
+import numpy as np
 from pathlib import Path
+from entropy_plot import calculate_entropy
 from pipeline.modules.build import build_hmm
+from pipeline.modules.hmm_kunitz import (merge_tblout, parse_tblout, parse_tblout_lines, partition_swissprot,
+                                         run_hmmsearch, split_fasta)
 
 def test_hmm_creation(tmp_path):
     test_aln = tmp_path / "test.sto"
     test_aln.write_text("# STOCKHOLM 1.0\nseq1 ACDEF\n//")
     build_hmm(test_aln, tmp_path / "test.hmm")
     assert (tmp_path / "test.hmm").exists()
+
+def test_parse_tblout(tmp_path):
+    tblout = tmp_path / "hits.tbl"
+    tblout.write_text(
+        "# target name  accession  query name  accession  E-value  score  bias\n"
+        "sp|P10646|TFPI1_HUMAN  -  kunitz  -  1.2e-30  95.1  0.3  Tissue factor pathway inhibitor\n"
+        "sp|P00974|BPT1_BOVIN  -  kunitz  -  0.01  12.0  0.1  Pancreatic trypsin inhibitor\n"
+        "# [ok]\n"
+    )
+    assert parse_tblout(tblout, 1e-5) == {"sp|P10646|TFPI1_HUMAN"}
+
+
+@pytest.mark.skipif(shutil.which("awk") is None, reason="awk not available")
+@pytest.mark.parametrize("cutoff", [1e-5, np.float64(1e-5), 0.05, float("inf"), 0.0])
+def test_parse_tblout_awk_matches_python(tmp_path, cutoff):
+    tblout = tmp_path / "hits.tbl"
+    tblout.write_text(
+        "# target name  accession  query name  accession  E-value  score  bias\n"
+        "a  -  kunitz  -  1.2e-30  95.1  0.3  first hit\n"
+        "b  -  kunitz  -  1e-05  20.0  0.1  on the cutoff\n"
+        "c  -  kunitz  -  0.01  12.0  0.1  weak hit\n"
+        "d  -  kunitz  -  n/a  0.0  0.0  malformed E-value\n"
+        "short line\n"
+    )
+    assert parse_tblout(tblout, cutoff) == parse_tblout_lines(tblout, cutoff)
+
+def test_partition_swissprot(tmp_path):
+    fasta = tmp_path / "sprot.fasta"
+    fasta.write_text(
+        ">sp|P10646|TFPI1_HUMAN Tissue factor pathway inhibitor (Kunitz) OS=Homo sapiens\nDSEEDEEHTIITDTELPPLKLM\n"
+        ">sp|P00974|BPT1_BOVIN Pancreatic trypsin inhibitor, Kunitz type OS=Bos taurus\nRPDFCLEPPYTGPCKARIIRYF\nYNAKAGLCQTFVYGG\n"
+        + "".join(f">sp|Q{i}|PROT{i}_MOUSE Some protein OS=Mus musculus\nMKV\n" for i in range(10))
+    )
+    human, nonhuman, negatives = partition_swissprot(fasta, 3, seed=42)
+    assert [header.split()[0] for header, _ in human] == [b">sp|P10646|TFPI1_HUMAN"]
+    assert nonhuman == [(b">sp|P00974|BPT1_BOVIN Pancreatic trypsin inhibitor, Kunitz type OS=Bos taurus\n",
+                         b"RPDFCLEPPYTGPCKARIIRYF\nYNAKAGLCQTFVYGG\n")]
+    assert len(negatives) == 3
+    assert all(b"Kunitz" not in header for header, _ in negatives)
+
+
+def test_split_fasta_round_robin(tmp_path):
+    fasta = tmp_path / "test_set.fasta"
+    fasta.write_text("".join(f">seq{i}\nMKV\nLLA\n" for i in range(5)))
+    shards = [tmp_path / f"shard_{i}.fasta" for i in range(3)]
+    assert split_fasta(fasta, shards) == 5
+    assert [[line for line in shard.read_text().splitlines() if line.startswith(">")] for shard in shards] == [
+        [">seq0", ">seq3"], [">seq1", ">seq4"], [">seq2"]]
+    assert shards[0].read_text() == ">seq0\nMKV\nLLA\n>seq3\nMKV\nLLA\n"
+
+
+def test_merge_tblout_keeps_first_shard_comments(tmp_path):
+    shards = [tmp_path / "a.tbl", tmp_path / "b.tbl"]
+    shards[0].write_text("# header\nseq0 - kunitz - 1e-10 50.0 0.1\n# [ok]\n")
+    shards[1].write_text("# header\nseq1 - kunitz - 1e-3 10.0 0.1\n# [ok]\n")
+    merge_tblout(shards, tmp_path / "hits.tbl")
+    assert (tmp_path / "hits.tbl").read_text() == (
+        "# header\nseq0 - kunitz - 1e-10 50.0 0.1\n# [ok]\nseq1 - kunitz - 1e-3 10.0 0.1\n")
+
+
+def test_run_hmmsearch_skips_empty_shards(tmp_path, monkeypatch):
+    fasta = tmp_path / "test_set.fasta"
+    fasta.write_text("".join(f">seq{i}\nMKV\n" for i in range(3)))
+    targets = []
+
+    def fake_run_command(command, description):
+        targets.append(Path(command[-1]).read_text())
+        Path(command[command.index("--tblout") + 1]).write_text("# header\n")
+
+    monkeypatch.setattr("pipeline.modules.hmm_kunitz.run_command", fake_run_command)
+    run_hmmsearch("kunitz.hmm", fasta, str(tmp_path / "hits.tbl"), n_threads=4, n_shards=10)
+    assert len(targets) == 3
+    assert all(targets)
+
+
+def test_calculate_entropy_reads_whole_lines(tmp_path):
+    alignment = tmp_path / "msa.fasta"
+    # Trailing whitespace and CRLF are ignored; internal spaces are part of the row, as with line.strip()
+    alignment.write_bytes(b">a\r\nAC DA \r\n>b\nAC DC\n\n>c\nAG DA\n")
+    assert calculate_entropy(alignment) == pytest.approx([0.0, 0.9182958, 0.0, 0.0, 0.9182958])
+
+
+def test_calculate_entropy_strips_indented_rows(tmp_path):
+    alignment = tmp_path / "msa.fasta"
+    alignment.write_bytes(b">a\nAC\n>b\n  AG\n>c\nAC\n>d\n\tAG\n")
+    assert calculate_entropy(alignment) == pytest.approx([0.0, 1.0])
+
+
+@pytest.mark.parametrize("rows", [b">a\nACGT\n>b\nAC\n>c\nACGTAC\n", b"CLUSTAL W\n\nseq1  ACDEFGHIKLMNPQRSTVWYACDEFGHIKLMNPQRSTVWYACDEFGHIKL\n"])
+def test_calculate_entropy_rejects_ragged_alignment(tmp_path, rows):
+    alignment = tmp_path / "msa.fasta"
+    alignment.write_bytes(rows)
+    with pytest.raises(ValueError, match="differ in length"):
+        calculate_entropy(alignment)